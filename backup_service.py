@@ -11,6 +11,54 @@ from tqdm import tqdm
 import hashlib
 from pathlib import Path
 import time
+import atexit
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import Counter, deque, namedtuple
+import functools
+from itertools import islice
+import contextlib
+import struct
+import queue
+import threading
+import mmap
+import sys
+
+# Prefer ISA-L's SIMD-accelerated DEFLATE when it is installed, then zlib-ng's.
+# Both are drop-in replacements for zlib, so zipfile is pointed at them as well.
+try:
+    from isal import isal_zlib as zlib
+    MAX_COMPRESSION_LEVEL = 3
+except ImportError:
+    try:
+        from zlib_ng import zlib_ng as zlib
+    except ImportError:
+        import zlib
+    MAX_COMPRESSION_LEVEL = 9
+
+zipfile.zlib = zlib
+zipfile.crc32 = zlib.crc32
+
+# BLAKE3 hashes several times faster than SHA-256 and can spread large files
+# over all cores. Manifest entries record which one produced their hash.
+try:
+    from blake3 import blake3
+    HASH_ALGO = 'blake3'
+except ImportError:
+    blake3 = None
+    HASH_ALGO = 'sha256'
+
+# orjson (de)serialises large manifests several times faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Backup runs lock their destination with whichever file locking the platform has
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
 
 # Get the script's directory
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -32,70 +80,183 @@ try:
     session_format = config.get("Backup", "session_format", fallback="zip").lower()
     backup_type = config.get("Backup", "type", fallback="full").lower()
     full_backup_interval = int(config.get("Backup", "full_backup_interval", fallback="7"))
+    compression_level = int(config.get("Backup", "compression_level", fallback="1"))
+    compression_method = config.get("Backup", "compression", fallback="deflate").strip().lower()
+    # Per-file and per-folder-entry log lines are only written in debug mode
+    debug_logging = config.getboolean("Logging", "debug", fallback=False)
 except Exception as e:
     raise Exception(f"Error parsing configuration: {str(e)}")
 
+# Level 0 stores files as-is. Zstandard needs zipfile support for it (Python 3.14+)
+# and otherwise falls back to DEFLATE, whose level is capped at what the backend supports.
+requested_compression_level = compression_level
+if compression_level == 0 or compression_method == 'stored':
+    zip_compression = zipfile.ZIP_STORED
+elif compression_method == 'zstd' and hasattr(zipfile, 'ZIP_ZSTANDARD'):
+    zip_compression = zipfile.ZIP_ZSTANDARD
+    compression_level = max(1, min(compression_level, 22))
+else:
+    zip_compression = zipfile.ZIP_DEFLATED
+    compression_level = max(0, min(compression_level, MAX_COMPRESSION_LEVEL))
+
+# Already-compressed formats gain next to nothing from DEFLATE, so they are stored as-is
+STORED_EXTS = frozenset({
+    '.zip', '.gz', '.xz', '.bz2', '.7z', '.rar',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp',
+    '.mp4', '.mkv', '.mov', '.avi', '.webm', '.mp3', '.flac', '.ogg', '.m4a',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp',
+})
+
 # Ensure the main backup destination exists
 os.makedirs(backup_destination, exist_ok=True)
 
 # Define the log file location
 log_file = os.path.join(backup_destination, "backup_log.txt")
 
+# Keep the log file open for the whole run and buffer writes, flushing on exit
+try:
+    log_handle = open(log_file, 'a', buffering=1 << 16)
+    atexit.register(log_handle.close)
+except Exception:
+    log_handle = None
+
+# Folders whose files total less than this are zipped in memory rather than via a temp file
+IN_MEMORY_ZIP_LIMIT = 64 * 1024 * 1024
+
+# Chunk size for streaming archive members to disk
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Chunks read ahead of the compressor when streaming large files
+READ_AHEAD_DEPTH = 4
+
+# Folders whose files total less than this are written straight into the session
+# archive under "<folder>/" instead of as a nested folder zip
+DIRECT_ZIP_LIMIT = 1024 * 1024
+
+# Files up to this size are read and compressed whole on a worker thread
+THREAD_COMPRESS_LIMIT = 4 * 1024 * 1024
+
+# Archive entry holding a backup's manifest: {'hash_algo': ..., 'files': {arcname: [hash, time, size]},
+# 'duplicates': {folder label: {arcname: stored arcname}}}
+MANIFEST_NAME = 'manifest.json'
+
+# Files above this size are hashed memory-mapped (with BLAKE3, across threads too)
+MMAP_HASH_LIMIT = 256 * 1024
+# Files above this size are hashed with a chunked reader instead; 32-bit interpreters
+# can't map them into their address space
+MMAP_MAX_SIZE = sys.maxsize // 4
+
+# Write buffer of the session archive, so small entries and headers go out in few writes
+SESSION_BUFFER_SIZE = 1024 * 1024
+
+# Threads hashing and compressing files, shared out between the folder processes.
+# Much of their time is spent waiting on reads, so there are more of them than cores.
+FILE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# The formatted timestamp only changes once a second, so it is reused between calls
+_log_second = None
+_log_timestamp = ""
+
 def log(message):
     """Write a timestamped message to the log file."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_message = f"{timestamp}: {message}"
+    global _log_second, _log_timestamp
+    now = int(time.time())
+    if now != _log_second:
+        _log_timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        _log_second = now
+    log_message = f"{_log_timestamp}: {message}"
     print(log_message)
-    try:
-        with open(log_file, 'a') as logf:
-            logf.write(log_message + "\n")
-    except Exception:
-        pass
+    if log_handle is not None:
+        try:
+            log_handle.write(log_message + "\n")
+        except Exception:
+            pass
+
+# One backup archive in backup_destination, as listed by backup_index
+Backup = namedtuple('Backup', 'name path ctime mtime is_full timestamp has_manifest')
+
+_backup_index = None
+
+def backup_index(refresh=False):
+    """List the backup archives in backup_destination, scanning it again only when refresh is set."""
+    global _backup_index
+    if _backup_index is None or refresh:
+        with os.scandir(backup_destination) as entries:
+            listing = {entry.name: entry for entry in entries}
+        backups = []
+        for name, entry in listing.items():
+            if not (name.startswith("backup_") and name.endswith(".zip")):
+                continue
+            # None if the name doesn't carry a parseable timestamp
+            try:
+                timestamp = datetime.strptime(name[-19:-4], "%Y%m%d_%H%M%S")
+            except ValueError:
+                timestamp = None
+            st = entry.stat()
+            backups.append(Backup(name, entry.path, st.st_ctime, st.st_mtime,
+                                  name.startswith("backup_full_"), timestamp,
+                                  name.replace('.zip', '_manifest.json') in listing))
+        backups.sort()
+        _backup_index = backups
+    return _backup_index
 
 def enforce_backup_limit():
     """Ensure that only the latest 'max_backups' number of backups are retained."""
-    backups = sorted(
-        (entry for entry in os.listdir(backup_destination) 
-         if entry.startswith("backup_") and entry.endswith(".zip")),
-        key=lambda entry: os.path.getmtime(os.path.join(backup_destination, entry))
-    )
+    backups = sorted(backup_index(refresh=True), key=lambda backup: backup.mtime)
     
     if len(backups) > max_backups:
         excess_backups = len(backups) - max_backups
-        for old_backup in backups[:excess_backups]:
-            backup_path = os.path.join(backup_destination, old_backup)
-            os.remove(backup_path)
-            log(f"Removed old backup: {backup_path}")
+        for backup in backups[:excess_backups]:
+            os.remove(backup.path)
+            log(f"Removed old backup: {backup.path}")
+        backup_index(refresh=True)
+
+# Lock file a backup run holds in backup_destination while it writes there
+LOCK_NAME = 'backup.lock'
+
+def lock_destination():
+    """Lock backup_destination until the process exits, returning False if another run holds it."""
+    lock_file = open(os.path.join(backup_destination, LOCK_NAME), 'a+b')
+    try:
+        if msvcrt is not None:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    atexit.register(lock_file.close)
+    return True
+
+def remove_partial_backups():
+    """Delete archives left under their temporary name by backup runs that were interrupted."""
+    # Only call this while holding the destination lock, or it deletes a running backup's archive
+    with os.scandir(backup_destination) as entries:
+        for entry in entries:
+            if entry.name.startswith("backup_") and entry.name.endswith(".zip.tmp"):
+                try:
+                    os.remove(entry.path)
+                    log(f"Removed incomplete backup: {entry.path}")
+                except OSError as e:
+                    log(f"Error removing incomplete backup {entry.path}: {str(e)}")
 
 def read_folders():
-    """Parse the folder list from the config file."""
-    folders = []
+    """Parse the folder list from the config file, yielding (folder_path, recursive) tuples."""
     try:
         if 'Folders' not in config.sections():
             raise configparser.NoSectionError('Folders')
             
         folder_list = config.get("Folders", "folders")
-        folder_entries = folder_list.split(";")
-        for entry in folder_entries:
+        for entry in folder_list.split(";"):
             entry = entry.strip()
             if entry:
                 folder_path, recursive_flag = map(str.strip, entry.rsplit(',', 1))
-                recursive = recursive_flag.upper() == 'R'
-                folders.append((folder_path, recursive))
-                log(f"Loaded folder '{folder_path}' with recursive setting '{recursive_flag}'")
+                if debug_logging:
+                    log(f"Loaded folder '{folder_path}' with recursive setting '{recursive_flag}'")
+                yield folder_path, recursive_flag.upper() == 'R'
     except Exception as e:
         log(f"Error reading folders: {str(e)}")
-    
-    return folders
-
-def verify_zip_content(zip_data):
-    """Verify if the data is a valid zip file."""
-    try:
-        with io.BytesIO(zip_data) as data_stream:
-            with zipfile.ZipFile(data_stream) as zf:
-                return True
-    except Exception:
-        return False
 
 def get_backup_chain(backup_name):
     """Get the backup chain (full + differential) needed for a complete restore."""
@@ -106,137 +267,558 @@ def get_backup_chain(backup_name):
         
     backup_time = datetime.strptime(backup_name.replace("backup_diff_", "").replace(".zip", ""), "%Y%m%d_%H%M%S")
     
-    full_backups = []
-    for entry in os.listdir(backup_destination):
-        if entry.startswith("backup_full_") and entry.endswith(".zip"):
-            full_time = datetime.strptime(entry.replace("backup_full_", "").replace(".zip", ""), "%Y%m%d_%H%M%S")
-            if full_time < backup_time:
-                full_backups.append((entry, full_time))
+    full_backups = [backup for backup in backup_index()
+                    if backup.is_full and backup.timestamp is not None and backup.timestamp < backup_time]
     
     if not full_backups:
         raise Exception("No base full backup found for differential backup")
         
-    base_backup = max(full_backups, key=lambda x: x[1])[0]
-    base_path = os.path.join(backup_destination, base_backup)
+    base_backup = max(full_backups, key=lambda backup: backup.timestamp)
     
-    return [(base_backup, base_path), (backup_name, backup_path)]
+    return [(base_backup.name, base_backup.path), (backup_name, backup_path)]
 
-def get_file_hash(file_path):
-    """Calculate SHA-256 hash of a file."""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+if blake3 is None:
+    try:
+        # Hashes only detect changes, so FIPS-restricted builds needn't fall back
+        # from OpenSSL's accelerated implementation
+        _sha256_template = hashlib.sha256(usedforsecurity=False)
+    except TypeError:
+        # usedforsecurity needs Python 3.9+
+        _sha256_template = hashlib.sha256()
+
+def new_hash(data=b''):
+    """Return a HASH_ALGO hash object, optionally fed with data."""
+    if blake3 is not None:
+        return blake3(data, max_threads=blake3.AUTO)
+    # Copying a fresh hasher is cheaper than constructing one, which adds up over many small files
+    file_hash = _sha256_template.copy()
+    if data:
+        file_hash.update(data)
+    return file_hash
+
+def get_file_hash(file_path, file_stat=None):
+    """Calculate the HASH_ALGO hash of a file; file_stat is its stat result if the caller has it."""
+    if file_stat is None:
+        file_stat = os.stat(file_path)
+    
+    file_hash = new_hash()
+    mappable = 0 < file_stat.st_size <= MMAP_MAX_SIZE
+    if blake3 is not None and mappable and file_stat.st_size > MMAP_HASH_LIMIT:
+        # Memory-mapped, multithreaded tree hashing
+        file_hash.update_mmap(file_path)
+    elif hasattr(hashlib, 'file_digest') and not (mappable and file_stat.st_size > MMAP_HASH_LIMIT):
+        with open(file_path, "rb", buffering=0) as f:
+            advise_sequential(f)
+            file_hash = hashlib.file_digest(f, new_hash)
+    elif mappable:
+        # One update over the mapping hashes straight from the page cache. Before
+        # Python 3.11 this is also the fallback for small files; empty files can't be mapped.
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            file_hash.update(mapped)
+    elif file_stat.st_size:
+        with open(file_path, "rb") as f:
+            advise_sequential(f)
+            for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+    return file_hash.hexdigest()
 
 def get_last_full_backup():
-    """Find the most recent full backup and its manifest."""
+    """Find the most recent full backup that has a manifest, returning (name, path)."""
     try:
-        for entry in sorted(os.listdir(backup_destination), reverse=True):
-            if entry.startswith("backup_full_"):
-                manifest_path = os.path.join(backup_destination, entry.replace('.zip', '_manifest.json'))
-                if os.path.exists(manifest_path):
-                    return entry, manifest_path
+        for backup in reversed(backup_index()):
+            if backup.is_full and (backup.has_manifest or has_embedded_manifest(backup.path)):
+                return backup.name, backup.path
     except Exception as e:
         log(f"Error finding last full backup: {str(e)}")
     return None, None
 
-def should_create_full_backup():
-    """Determine if a new full backup should be created."""
-    last_full_backup, _ = get_last_full_backup()
+def should_create_full_backup(last_full_backup):
+    """Determine if a new full backup should be created, given get_last_full_backup's name."""
     if not last_full_backup:
         return True
         
-    last_full_time = os.path.getctime(os.path.join(backup_destination, last_full_backup))
+    last_full_time = next(backup.ctime for backup in backup_index() if backup.name == last_full_backup)
     days_since_full = (time.time() - last_full_time) / (24 * 3600)
     return days_since_full >= full_backup_interval
 
-def count_files(folder_path, recursive=True):
-    """Count total files in a folder."""
-    count = 0
-    for root, _, files in os.walk(folder_path):
-        count += len(files)
-        if not recursive:
-            break
-    return count
-
-def backup_folder(main_zip, folder_path, recursive, manifest=None, base_manifest=None):
-    """Backup a folder with progress bar and optional differential backup."""
+def iter_files(folder_path, recursive=True):
+    """Yield (DirEntry, arcname) for every file in a folder, walking it with os.scandir."""
+    # DirEntry caches the file type from the listing, so classifying entries costs no
+    # stat calls. arcnames are built by concatenation and always use '/'.
+    pending_dirs = [(folder_path, '')]
+    while pending_dirs:
+        dir_path, prefix = pending_dirs.pop()
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    # Like os.walk, directory symlinks aren't descended into,
+                    # but symlinked files are followed and backed up as files
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            pending_dirs.append((entry.path, prefix + entry.name + '/'))
+                    elif entry.is_file():
+                        yield entry, prefix + entry.name
+        except OSError:
+            # Unreadable subdirectories are skipped, as os.walk does
+            continue
+
+def scan_folder(folder_path, recursive=True):
+    """List a folder's (file_path, arcname, file_stat) tuples along with their combined size in bytes."""
+    files = []
+    total_size = 0
+    for entry, arcname in iter_files(folder_path, recursive):
+        try:
+            file_stat = entry.stat()
+            total_size += file_stat.st_size
+        except OSError:
+            # Stat'ed again when the file is processed
+            file_stat = None
+        files.append((entry.path, arcname, file_stat))
+    return files, total_size
+
+def zipinfo_from_stat(file_stat, arcname):
+    """Build the ZipInfo ZipInfo.from_file would, from an existing stat result."""
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(file_stat.st_mtime)[:6])
+    zinfo.external_attr = (file_stat.st_mode & 0xFFFF) << 16
+    zinfo.file_size = file_stat.st_size
+    return zinfo
+
+def compression_for(file_path):
+    """Pick the zip compression method for a file based on its extension."""
+    if os.path.splitext(file_path)[1].lower() in STORED_EXTS:
+        return zipfile.ZIP_STORED
+    return zip_compression
+
+def unchanged_since_base(base_manifest, arcname, file_stat):
+    """Tell whether a file's mtime and size match its base manifest entry, which rsync also takes as unchanged."""
+    if not base_manifest or file_stat is None:
+        return False
+    base_info = base_manifest.get(arcname)
+    return base_info is not None and base_info[1] == file_stat.st_mtime and base_info[2] == file_stat.st_size
+
+# Base manifest entry of files the base backup doesn't have
+_NO_BASE_ENTRY = (None, None, None)
+
+def compress_file(file_path, arcname, file_stat=None, base_manifest=None, entry_prefix='',
+                  size_limit=THREAD_COMPRESS_LIMIT, seen_hashes=None, shared_sizes=()):
+    """Hash a file and, if it changed since the base backup, compress it in memory."""
+    # Runs on a worker thread; returns (file_hash, file_time, changed, zinfo, payload, duplicate_of)
+    if file_stat is None:
+        file_stat = os.stat(file_path)
+    file_time = file_stat.st_mtime
+    base_hash, base_time, base_size = base_manifest.get(arcname, _NO_BASE_ENTRY) if base_manifest else _NO_BASE_ENTRY
+    # Files above size_limit come back without zinfo and payload, for write_file_streamed.
+    # They are only hashed here when a base entry without size has the same mtime, or
+    # when their size is in shared_sizes, so a copy is caught before it is written.
+    streamed = size_limit is not None and file_stat.st_size > size_limit
+    
+    if streamed:
+        if file_stat.st_size not in shared_sizes and (
+                base_hash is None or base_time != file_time or base_size is not None):
+            return None, file_time, True, None, None, None
+        file_hash = get_file_hash(file_path, file_stat)
+    else:
+        # Small files are read once and hashed from memory
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        file_hash = new_hash(data).hexdigest()
+    
+    if base_hash == file_hash and base_time == file_time:
+        return file_hash, file_time, False, None, None, None
+    
+    # Built before the hash is claimed, as it fails for timestamps zip can't hold
+    zinfo = None if streamed else zipinfo_from_stat(file_stat, entry_prefix + arcname)
+    
+    if seen_hashes is not None:
+        # setdefault is atomic, so exactly one thread claims each hash
+        original = seen_hashes.setdefault(file_hash, arcname)
+        if original != arcname:
+            return file_hash, file_time, True, None, None, original
+    
+    if streamed:
+        return file_hash, file_time, True, None, None, None
+    
+    zinfo.compress_type = compression_for(file_path)
+    if zinfo.compress_type == zipfile.ZIP_STORED:
+        payload = data
+    else:
+        compressor = new_compressor(zinfo.compress_type)
+        payload = compressor.compress(data) + compressor.flush()
+    zinfo.file_size = len(data)
+    zinfo.compress_size = len(payload)
+    zinfo.CRC = zlib.crc32(data)
+    return file_hash, file_time, True, zinfo, payload, None
+
+def stored_entry(name, data):
+    """Build a (zinfo, payload) pair for data stored uncompressed, as ZipFile.writestr would."""
+    zinfo = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.external_attr = 0o600 << 16
+    zinfo.file_size = zinfo.compress_size = len(data)
+    zinfo.CRC = zlib.crc32(data)
+    return zinfo, data
+
+# zipfile has no public API for writing an entry whose data is produced elsewhere, so
+# new_compressor and EntryWriter use its internals (_get_compressor, _lock, _seekable,
+# _writecheck, _didModify, start_dir). Checked against CPython 3.7 to 3.14, the first
+# version whose _get_compressor handles ZIP_ZSTANDARD.
+
+# General purpose flag bit 3: CRC and sizes follow the data in a data descriptor
+DATA_DESCRIPTOR_FLAG = 0x08
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+
+def new_compressor(compress_type):
+    """Return a raw compressor for a zip entry of compress_type, or None for stored entries."""
+    if compress_type == zipfile.ZIP_STORED:
+        return None
+    if compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.compressobj(compression_level, zlib.DEFLATED, -15)
+    return zipfile._get_compressor(compress_type, compression_level)
+
+class EntryWriter:
+    """Append one entry to a ZipFile by writing its local header and data straight to the archive."""
+    
+    def __init__(self, zip_file, zinfo, zip64=None, sized=False):
+        # sized: zinfo already carries the CRC and sizes, so the header needs no fixing up
+        self.zip_file = zip_file
+        self.zinfo = zinfo
+        self.zip64 = zip64
+        self.sized = sized
+        self.discarded = False
+    
+    def __enter__(self):
+        zip_file, zinfo = self.zip_file, self.zinfo
+        zip_file._lock.acquire()
+        try:
+            if not self.sized:
+                zinfo.CRC = zinfo.file_size = zinfo.compress_size = 0
+                if not zip_file._seekable:
+                    zinfo.flag_bits |= DATA_DESCRIPTOR_FLAG
+            # Seeking flushes a buffered file, so only seek when something moved the position
+            if zip_file._seekable and zip_file.fp.tell() != zip_file.start_dir:
+                zip_file.fp.seek(zip_file.start_dir)
+            zinfo.header_offset = zip_file.fp.tell()
+            zip_file._writecheck(zinfo)
+            zip_file._didModify = True
+            zip_file.fp.write(zinfo.FileHeader(self.zip64))
+        except BaseException:
+            zip_file._lock.release()
+            raise
+        return self
+    
+    def write(self, data):
+        self.zip_file.fp.write(data)
+        if not self.sized:
+            self.zinfo.compress_size += len(data)
+    
+    def discard(self):
+        """Drop the entry again, which needs a seekable archive; returns whether it was dropped."""
+        if not self.zip_file._seekable:
+            return False
+        self.zip_file.fp.seek(self.zinfo.header_offset)
+        self.zip_file.fp.truncate()
+        self.discarded = True
+        return True
+    
+    def __exit__(self, exc_type, exc, tb):
+        zip_file, zinfo = self.zip_file, self.zinfo
+        try:
+            if exc_type is not None:
+                # Mode 'w' doesn't truncate on close, so a large half-written entry
+                # left after the central directory would hide it
+                self.discard()
+            elif not self.discarded:
+                if not self.sized and zip_file._seekable:
+                    # Rewrite the local header now that CRC and sizes are known
+                    end = zip_file.fp.tell()
+                    zip_file.fp.seek(zinfo.header_offset)
+                    zip_file.fp.write(zinfo.FileHeader(self.zip64))
+                    zip_file.fp.seek(end)
+                elif not self.sized:
+                    zip_file.fp.write(struct.pack('<LLQQ' if self.zip64 else '<LLLL', DATA_DESCRIPTOR_SIGNATURE,
+                                                  zinfo.CRC, zinfo.compress_size, zinfo.file_size))
+                zip_file.filelist.append(zinfo)
+                zip_file.NameToInfo[zinfo.filename] = zinfo
+                zip_file.start_dir = zip_file.fp.tell()
+        finally:
+            zip_file._lock.release()
+        return False
+
+def write_compressed(zip_file, zinfo, payload):
+    """Append an entry whose payload and CRC were already computed, as ZipFile.writestr would."""
+    with EntryWriter(zip_file, zinfo, sized=True) as entry:
+        entry.write(payload)
+
+def advise_sequential(f):
+    """Tell the kernel f will be read front to back, so it reads ahead further (POSIX only)."""
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+def read_ahead(src, chunk_size=COPY_CHUNK_SIZE, depth=READ_AHEAD_DEPTH):
+    """Yield chunks of src while a background thread reads up to depth chunks ahead."""
+    advise_sequential(src)
+    chunks = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def reader():
+        try:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                if not put(chunk):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+    
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+def write_file_streamed(zip_file, file_path, arcname, seen_hashes=None, file_stat=None):
+    """Stream a file into zip_file, returning (zinfo, file_hash, duplicate_of); zinfo is None for a duplicate."""
+    zinfo = zipinfo_from_stat(file_stat or os.stat(file_path), arcname)
+    zinfo.compress_type = compression_for(file_path)
+    # Same headroom rule ZipFile uses to decide on ZIP64 before the size is known
+    zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    compressor = new_compressor(zinfo.compress_type)
+    file_hash = new_hash()
+    
+    with open(file_path, 'rb') as src, EntryWriter(zip_file, zinfo, zip64) as entry:
+        # CRC and content hash are taken as the chunks go by; the next ones are read meanwhile
+        for chunk in read_ahead(src):
+            file_hash.update(chunk)
+            zinfo.CRC = zlib.crc32(chunk, zinfo.CRC)
+            zinfo.file_size += len(chunk)
+            entry.write(compressor.compress(chunk) if compressor is not None else chunk)
+        if compressor is not None:
+            entry.write(compressor.flush())
+        
+        if not zip64 and max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+            raise RuntimeError(f"{file_path} grew past the ZIP64 limit while being backed up")
+        
+        file_hash = file_hash.hexdigest()
+        if seen_hashes is not None:
+            original = seen_hashes.setdefault(file_hash, arcname)
+            # A duplicate is cut off the archive again where it can seek; otherwise the copy stays
+            if original != arcname and entry.discard():
+                return None, file_hash, original
+    return zinfo, file_hash, None
+
+def submit_bounded(executor, fn, items, max_pending):
+    """Submit fn(*item) for each item, yielding (item, future) in order with at most max_pending in flight."""
+    pending = deque()
+    for item in items:
+        pending.append((item, executor.submit(fn, *item)))
+        if len(pending) >= max_pending:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+def completed_bounded(executor, fn, items, max_pending):
+    """Submit fn(*item) for each item, yielding (item, future) as they finish with at most max_pending in flight."""
+    items = iter(items)
+    pending = {executor.submit(fn, *item): item for item in islice(items, max_pending)}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            # The next item is submitted first, so workers stay busy meanwhile
+            item = pending.pop(future)
+            next_item = next(items, None)
+            if next_item is not None:
+                pending[executor.submit(fn, *next_item)] = next_item
+            yield item, future
+
+def backup_folder(folder_path, recursive, base_manifest=None, position=0, session_zip=None, files=None,
+                  file_workers=FILE_WORKERS):
+    """Zip a folder with progress bar and optional differential backup."""
+    # Runs in a worker process and returns (folder_zip_filename, zip_data, deferred_files,
+    # entries, manifest, duplicates, files_processed, messages); log messages are handed
+    # back to the parent rather than written from the worker
+    messages = []
+    folder_name = os.path.basename(folder_path.strip('/\\'))
+    folder_zip_filename = f"{folder_name}.zip"
+
     if not os.path.exists(folder_path):
-        log(f"Error: Folder '{folder_path}' does not exist. Skipping backup.")
-        return {}, 0
+        messages.append(f"Error: Folder '{folder_path}' does not exist. Skipping backup.")
+        return folder_zip_filename, None, None, None, {}, {}, 0, messages
 
     try:
-        total_files = count_files(folder_path, recursive)
-        if total_files == 0:
-            return {}, 0
-            
-        folder_name = os.path.basename(folder_path.strip('/\\'))
-        folder_zip_filename = f"{folder_name}.zip"
+        if files is None:
+            files, _ = scan_folder(folder_path, recursive)
+        if not files:
+            return folder_zip_filename, None, None, None, {}, {}, 0, messages
+        
+        # Files unchanged since the base backup never reach the thread pool, and
+        # don't count towards the size that picks how the folder is zipped.
+        # Full backups have nothing to compare against, so the filter is skipped.
+        if base_manifest:
+            changed_files = [(file_path, arcname, file_stat) for file_path, arcname, file_stat in files
+                             if not unchanged_since_base(base_manifest, arcname, file_stat)]
+        else:
+            changed_files = files
+        total_size = sum(file_stat.st_size for _, _, file_stat in changed_files if file_stat is not None)
+        # Folders above IN_MEMORY_ZIP_LIMIT are only scanned here; the parent calls
+        # backup_folder again with session_zip to stream them into the session archive
+        if session_zip is None and total_size > IN_MEMORY_ZIP_LIMIT:
+            return folder_zip_filename, None, files, None, {}, {}, 0, messages
         
-        files_processed = 0
+        files_processed = len(files) - len(changed_files)
+        files_added = 0
+        bytes_added = 0
         current_manifest = {}
+        entries = None
+        zip_buffer = None
+        seen_hashes = {}
+        duplicates = {}
+        stored_names = set()
         
-        with tempfile.NamedTemporaryFile(delete=False) as temp_zip:
-            with zipfile.ZipFile(temp_zip.name, 'w', zipfile.ZIP_DEFLATED) as folder_zip:
+        with contextlib.ExitStack() as stack:
+            # Small folders skip the nested zip: the parent writes their entries under "<folder>/"
+            if session_zip is None and total_size < DIRECT_ZIP_LIMIT:
+                entries = [stored_entry(f"{folder_name}/path.txt", folder_path.encode('utf-8'))]
+                compress = functools.partial(compress_file, base_manifest=base_manifest,
+                                             entry_prefix=f"{folder_name}/", size_limit=None,
+                                             seen_hashes=seen_hashes)
+            else:
+                if session_zip is None:
+                    zip_buffer = io.BytesIO()
+                else:
+                    # The size isn't known up front, so the member needs ZIP64 headroom
+                    zip_buffer = stack.enter_context(session_zip.open(folder_zip_filename, 'w', force_zip64=True))
+                folder_zip = stack.enter_context(zipfile.ZipFile(zip_buffer, 'w', zip_compression,
+                                                             compresslevel=compression_level))
                 folder_zip.writestr('path.txt', folder_path)
-                
-                with tqdm(total=total_files, desc=f"Backing up {folder_name}", unit="files") as pbar:
-                    for root, _, files in os.walk(folder_path):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            arcname = os.path.relpath(file_path, folder_path)
-                            
-                            try:
-                                file_hash = get_file_hash(file_path)
-                                file_time = os.path.getmtime(file_path)
-                                
-                                if base_manifest is not None:
-                                    base_info = base_manifest.get(arcname, {})
-                                    if (base_info.get('hash') == file_hash and 
-                                        base_info.get('time') == file_time):
-                                        pbar.update(1)
-                                        files_processed += 1
-                                        continue
-                                
-                                folder_zip.write(file_path, arcname)
-                                current_manifest[arcname] = {
-                                    'hash': file_hash,
-                                    'time': file_time
-                                }
-                                
-                                pbar.update(1)
-                                files_processed += 1
-                                
-                            except Exception as e:
-                                log(f"Error adding file {file_path}: {str(e)}")
-                        
-                        if not recursive:
-                            break
+                shared_sizes = ()
+                if session_zip is not None:
+                    # A streamed copy can't be cut off the unseekable member again, so large
+                    # files sharing their size with another are hashed before they are written
+                    size_counts = Counter(file_stat.st_size for _, _, file_stat in changed_files if file_stat is not None)
+                    shared_sizes = {size for size, count in size_counts.items() if count > 1}
+                compress = functools.partial(compress_file, base_manifest=base_manifest,
+                                             seen_hashes=seen_hashes, shared_sizes=shared_sizes)
             
-            if files_processed > 0:
-                with open(temp_zip.name, 'rb') as f:
-                    zip_data = f.read()
-                    if verify_zip_content(zip_data):
-                        main_zip.writestr(folder_zip_filename, zip_data)
+            pbar = stack.enter_context(tqdm(total=len(files), initial=files_processed, desc=f"Backing up {folder_name}",
+                                            unit="files", position=position))
+            pool = stack.enter_context(ThreadPoolExecutor(max_workers=file_workers))
             
-            try:
-                os.unlink(temp_zip.name)
-            except Exception:
-                pass
+            # Each result in flight holds a file's data, so the window stays at the pool size
+            for (file_path, arcname, file_stat), future in submit_bounded(pool, compress, changed_files, file_workers + 1):
+                try:
+                    file_hash, file_time, changed, zinfo, payload, duplicate_of = future.result()
+                    if file_stat is None:
+                        file_stat = os.stat(file_path)
+                    
+                    if changed:
+                        if duplicate_of is None:
+                            if entries is not None:
+                                entries.append((zinfo, payload))
+                            elif zinfo is None:
+                                # A file hashed up front has already claimed its hash
+                                zinfo, streamed_hash, duplicate_of = write_file_streamed(
+                                    folder_zip, file_path, arcname, seen_hashes if file_hash is None else None, file_stat)
+                                file_hash = file_hash or streamed_hash
+                            else:
+                                write_compressed(folder_zip, zinfo, payload)
+                        if duplicate_of is not None:
+                            duplicates[arcname] = (duplicate_of, file_path, file_stat)
+                        current_manifest[arcname] = [file_hash, file_time, file_stat.st_size]
+                        files_added += 1
+                        if duplicate_of is None:
+                            stored_names.add(arcname)
+                            bytes_added += zinfo.file_size
+                        if debug_logging:
+                            messages.append(f"Added '{arcname}' to {folder_zip_filename}")
+                    
+                    pbar.update(1)
+                    files_processed += 1
                     
-        return current_manifest, files_processed
+                except Exception as e:
+                    messages.append(f"Error adding file {file_path}: {str(e)}")
+            
+            # When the file that claimed some content failed to be stored, its first copy
+            # is stored in its place and the other copies point to that one
+            stored_duplicates = {}
+            stand_ins = {}
+            for arcname, (original, file_path, file_stat) in duplicates.items():
+                original = stand_ins.get(original, original)
+                if original in stored_names:
+                    stored_duplicates[arcname] = original
+                    continue
+                try:
+                    _, _, _, zinfo, payload, _ = compress(file_path, arcname, file_stat, seen_hashes=None)
+                    if entries is not None:
+                        entries.append((zinfo, payload))
+                    elif zinfo is None:
+                        zinfo, _, _ = write_file_streamed(folder_zip, file_path, arcname, file_stat=file_stat)
+                    else:
+                        write_compressed(folder_zip, zinfo, payload)
+                    stored_names.add(arcname)
+                    stand_ins[original] = arcname
+                    bytes_added += zinfo.file_size
+                except Exception as e:
+                    # Dropped from the manifest, so the next backup tries it again
+                    messages.append(f"Error adding file {file_path}: {str(e)}")
+                    current_manifest.pop(arcname, None)
+        
+        zip_data = zip_buffer.getvalue() if isinstance(zip_buffer, io.BytesIO) else None
+        messages.append(f"Backed up '{folder_path}': added {files_added} files "
+                        f"({len(stored_duplicates)} duplicates), {bytes_added} bytes")
+        
+        if files_processed == 0:
+            zip_data, entries = None, None
+        
+        return (folder_zip_filename, zip_data, None, entries, current_manifest, stored_duplicates,
+                files_processed, messages)
     
     except Exception as e:
-        log(f"Error backing up '{folder_path}': {str(e)}")
-        return {}, 0
+        messages.append(f"Error backing up '{folder_path}': {str(e)}")
+        return folder_zip_filename, None, None, None, {}, {}, 0, messages
+
+# Base manifest of the backup being run, set once in each folder process by init_folder_worker
+_worker_base_manifest = None
+
+def init_folder_worker(base_manifest):
+    """Keep the base manifest in a folder process, so it isn't pickled into every folder's task."""
+    global _worker_base_manifest
+    _worker_base_manifest = base_manifest
+
+def backup_folder_in_worker(folder_path, recursive, position, file_workers=FILE_WORKERS):
+    """Run backup_folder in a folder process against the base manifest init_folder_worker kept."""
+    return backup_folder(folder_path, recursive, _worker_base_manifest, position, file_workers=file_workers)
+
 def fix_bad_zipfile(zip_path):
     """Try to fix a corrupted zip file."""
     try:
         log(f"Attempting to fix zip file: {zip_path}")
         with open(zip_path, 'r+b') as f:
-            data = f.read()
-            pos = data.find(b'PK\x05\x06')  # End of central directory signature
+            # The end of central directory record is at the end of the archive, so scan
+            # backwards over a read-only mapping instead of reading the file into memory.
+            # Nested folder zips carry their own records, which a forward search would hit first.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                pos = mapped.rfind(b'PK\x05\x06')  # End of central directory signature
             if pos > 0:
                 log(f"Truncating file at position {pos + 22}")
                 f.seek(pos + 22)   # Size of 'ZIP end of central directory record'
@@ -262,12 +844,7 @@ def safely_open_zip(zip_path, mode='r'):
 def list_backups():
     """List all available backups with their creation dates."""
     try:
-        backups = []
-        for entry in os.listdir(backup_destination):
-            if entry.startswith("backup_") and entry.endswith(".zip"):
-                backup_path = os.path.join(backup_destination, entry)
-                creation_time = datetime.fromtimestamp(os.path.getctime(backup_path))
-                backups.append((entry, creation_time))
+        backups = [(backup.name, datetime.fromtimestamp(backup.ctime)) for backup in backup_index()]
         
         # Sort backups by creation time (newest first)
         backups.sort(key=lambda x: x[1], reverse=True)
@@ -285,6 +862,174 @@ def list_backups():
         log(f"Error listing backups: {str(e)}")
         return []
 
+def entry_mtime(file_info):
+    """Return an archive entry's modification time as a timestamp."""
+    return time.mktime(file_info.date_time + (0, 0, -1))
+
+def matches_entry(st, file_info):
+    """Tell whether a file's stat result has an archive entry's size and mtime, within zip's two-second resolution."""
+    return st.st_size == file_info.file_size and 0 <= st.st_mtime - entry_mtime(file_info) < 2
+
+# Characters Windows doesn't allow in file names, replaced with '_' as ZipFile.extract does
+WINDOWS_NAME_TABLE = str.maketrans(':<>|"?*', '_______')
+
+def restore_target(root, name):
+    """Map an archive name to a path under root, dropping drive, '.' and '..' parts as ZipFile.extract does."""
+    name = name.replace('/', os.sep)
+    if os.altsep:
+        name = name.replace(os.altsep, os.sep)
+    name = os.path.splitdrive(name)[1]
+    parts = [part for part in name.split(os.sep) if part not in ('', os.curdir, os.pardir)]
+    if os.sep == '\\':
+        # Windows also drops trailing dots and spaces, which can leave a part empty
+        parts = [part.translate(WINDOWS_NAME_TABLE).rstrip(' .') for part in parts]
+        parts = [part for part in parts if part]
+    return os.path.join(root, *parts) if parts else None
+
+def extract_entry(source_zip, file_info, target_path):
+    """Write a single archive entry to target_path with the entry's mtime, creating parent directories as needed."""
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    with source_zip.open(file_info) as src, open(target_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, length=COPY_CHUNK_SIZE)
+    mtime = entry_mtime(file_info)
+    os.utime(target_path, (mtime, mtime))
+
+def member_data_offset(archive, file_info):
+    """Return where a member's data starts in archive, an open file of the zip it belongs to."""
+    archive.seek(file_info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, archive.read(zipfile.sizeFileHeader))
+    # The signature comes first; the name and extra field lengths are the last two fields
+    if header[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local file header for {file_info.filename}")
+    return file_info.header_offset + zipfile.sizeFileHeader + header[-2] + header[-1]
+
+class StoredMember(io.RawIOBase):
+    """A read-only, seekable view of a stored member's bytes inside its archive file."""
+    
+    # Lets ZipFile read a stored folder zip in place. zipfile's CRC check of the member is
+    # skipped; the nested zip's own entries are still checked on extraction.
+    def __init__(self, archive_path, file_info):
+        super().__init__()
+        self._file = open(archive_path, 'rb')
+        try:
+            self._start = member_data_offset(self._file, file_info)
+        except Exception:
+            self._file.close()
+            raise
+        self._size = file_info.file_size
+        self._pos = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def tell(self):
+        return self._pos
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = offset
+        return self._pos
+    
+    def readinto(self, buffer):
+        count = min(len(buffer), max(0, self._size - self._pos))
+        if count == 0:
+            return 0
+        self._file.seek(self._start + self._pos)
+        count = self._file.readinto(memoryview(buffer)[:count])
+        self._pos += count
+        return count
+    
+    def close(self):
+        self._file.close()
+        super().close()
+
+def restore_folder(source_zip, prefix, folder_label, is_base_backup, restored_files, duplicates=None):
+    """Restore one backed-up folder whose entries live under prefix ('' or '<folder>/') in source_zip."""
+    # Read the original path from path.txt
+    try:
+        original_path = source_zip.read(prefix + 'path.txt').decode('utf-8').strip()
+    except KeyError:
+        log(f"Warning: path.txt not found in {folder_label}, skipping...")
+        return
+    
+    # If this is the first backup in chain or the folder doesn't exist
+    if is_base_backup or not os.path.exists(original_path):
+        print(f"\nPreparing to restore {folder_label} to {original_path}")
+        if input("Continue with restore? (y/n): ").lower() != 'y':
+            print(f"Skipping restore of {folder_label}")
+            return
+    
+    # Verify the target directory
+    if not os.path.exists(os.path.dirname(original_path)):
+        print(f"Warning: Parent directory {os.path.dirname(original_path)} doesn't exist.")
+        if input("Create parent directory? (y/n): ").lower() != 'y':
+            print(f"Skipping restore of {folder_label}")
+            return
+    
+    # Create the destination directory if it doesn't exist
+    os.makedirs(original_path, exist_ok=True)
+    
+    # Extract all files except our own metadata entries
+    folder_files = []
+    for file_info in source_zip.infolist():
+        if not file_info.filename.startswith(prefix):
+            continue
+        relative_name = file_info.filename[len(prefix):]
+        if relative_name != 'path.txt' and not file_info.is_dir():
+            folder_files.append((relative_name, file_info))
+    for relative_name, original in (duplicates or {}).items():
+        try:
+            folder_files.append((relative_name, source_zip.getinfo(prefix + original)))
+        except KeyError:
+            log(f"Warning: {relative_name} refers to missing entry {original}, skipping...")
+    
+    for relative_name, file_info in folder_files:
+        target_path = restore_target(original_path, relative_name)
+        if target_path is None:
+            log(f"Warning: {relative_name} has no usable path, skipping...")
+            continue
+        file_key = (original_path, relative_name)
+        
+        # Skip if we've already restored this file from a previous backup in the chain
+        if file_key in restored_files:
+            continue
+        
+        try:
+            target_stat = os.stat(target_path)
+        except OSError:
+            target_stat = None
+        
+        # A file with the entry's size and mtime is taken to be this version already
+        if target_stat is not None and matches_entry(target_stat, file_info):
+            if debug_logging:
+                log(f"Unchanged, not rewritten: {target_path}")
+            restored_files.add(file_key)
+            continue
+        
+        # For files from differential backup or if file doesn't exist
+        if not is_base_backup or target_stat is None:
+            extract_entry(source_zip, file_info, target_path)
+            log(f"Restored: {target_path}")
+            restored_files.add(file_key)
+        else:
+            # For full backup files that exist, ask before overwriting
+            if input(f"File {relative_name} already exists. Overwrite? (y/n): ").lower() == 'y':
+                extract_entry(source_zip, file_info, target_path)
+                log(f"Restored: {target_path}")
+                restored_files.add(file_key)
+            else:
+                log(f"Skipped existing file: {target_path}")
+    
+    log(f"Completed restore of {folder_label} to {original_path}")
+
 def restore_backup(backup_name, selected_folders=None):
     """Restore a backup, optionally selecting specific folders to restore."""
     try:
@@ -300,28 +1045,56 @@ def restore_backup(backup_name, selected_folders=None):
             # Process each backup in the chain
             for chain_backup_name, chain_backup_path in backup_chain:
                 log(f"Processing backup: {chain_backup_name}")
+                is_base_backup = chain_backup_name == backup_chain[0][0]
                 
                 with safely_open_zip(chain_backup_path) as backup_zip:
-                    # List all folder zips in the backup
-                    folder_zips = [name for name in backup_zip.namelist() if name.endswith('.zip')]
+                    duplicates = load_duplicates(backup_zip)
+                    
+                    # Folders are stored as nested zips, or directly under "<folder>/" when small
+                    names = backup_zip.namelist()
+                    folder_zips = [name for name in names if name.endswith('.zip') and '/' not in name]
+                    folder_dirs = [name[:-len('path.txt')] for name in names
+                                   if name.endswith('/path.txt') and name.count('/') == 1]
                     
-                    if not folder_zips:
+                    if not folder_zips and not folder_dirs:
                         log("No folder zips found in backup")
                         print("No folders found in backup to restore!")
                         return
                     
                     if selected_folders:
-                        folder_zips = [f"{folder}.zip" for folder in selected_folders if f"{folder}.zip" in folder_zips]
+                        zip_names, dir_names = set(folder_zips), set(folder_dirs)
+                        folder_zips = [name for name in (f"{folder}.zip" for folder in selected_folders) if name in zip_names]
+                        folder_dirs = [name for name in (f"{folder}/" for folder in selected_folders) if name in dir_names]
+                    
+                    for folder_dir in folder_dirs:
+                        log(f"Processing {folder_dir}")
+                        try:
+                            restore_folder(backup_zip, folder_dir, folder_dir, is_base_backup, restored_files,
+                                           duplicates.get(folder_dir))
+                        except Exception as e:
+                            log(f"Error processing folder {folder_dir}: {str(e)}")
+                            print(f"Failed to restore {folder_dir}: {str(e)}")
                     
                     for folder_zip_name in folder_zips:
-                        temp_zip_path = os.path.join(temp_dir, f"temp_{folder_zip_name}")
                         log(f"Processing {folder_zip_name}")
+                        file_info = backup_zip.getinfo(folder_zip_name)
+                        
+                        if file_info.compress_type == zipfile.ZIP_STORED:
+                            # Read the folder zip in place inside the session archive
+                            try:
+                                with StoredMember(chain_backup_path, file_info) as stream, \
+                                        zipfile.ZipFile(stream) as folder_zip:
+                                    restore_folder(folder_zip, '', folder_zip_name, is_base_backup, restored_files,
+                                                   duplicates.get(folder_zip_name))
+                            except Exception as e:
+                                log(f"Error processing folder zip {folder_zip_name}: {str(e)}")
+                                print(f"Failed to restore {folder_zip_name}: {str(e)}")
+                            continue
                         
-                        # Extract the folder zip to the temporary directory
+                        # Older backups deflated the folder zips; extract those to the temporary directory
+                        temp_zip_path = os.path.join(temp_dir, f"temp_{folder_zip_name}")
                         try:
-                            zip_data = backup_zip.read(folder_zip_name)
-                            with open(temp_zip_path, 'wb') as f:
-                                f.write(zip_data)
+                            extract_entry(backup_zip, file_info, temp_zip_path)
                         except Exception as e:
                             log(f"Error extracting {folder_zip_name}: {str(e)}")
                             continue
@@ -329,57 +1102,8 @@ def restore_backup(backup_name, selected_folders=None):
                         # Now open the extracted zip file
                         try:
                             with safely_open_zip(temp_zip_path) as folder_zip:
-                                # Read the original path from path.txt
-                                try:
-                                    original_path = folder_zip.read('path.txt').decode('utf-8').strip()
-                                except KeyError:
-                                    log(f"Warning: path.txt not found in {folder_zip_name}, skipping...")
-                                    continue
-                                
-                                # If this is the first backup in chain or the folder doesn't exist
-                                if chain_backup_name == backup_chain[0][0] or not os.path.exists(original_path):
-                                    print(f"\nPreparing to restore {folder_zip_name} to {original_path}")
-                                    if input("Continue with restore? (y/n): ").lower() != 'y':
-                                        print(f"Skipping restore of {folder_zip_name}")
-                                        continue
-                                
-                                # Verify the target directory
-                                if not os.path.exists(os.path.dirname(original_path)):
-                                    print(f"Warning: Parent directory {os.path.dirname(original_path)} doesn't exist.")
-                                    if input("Create parent directory? (y/n): ").lower() != 'y':
-                                        print(f"Skipping restore of {folder_zip_name}")
-                                        continue
-                                
-                                # Create the destination directory if it doesn't exist
-                                os.makedirs(original_path, exist_ok=True)
-                                
-                                # Extract all files except path.txt
-                                for file_info in folder_zip.filelist:
-                                    if file_info.filename == 'path.txt':
-                                        continue
-                                        
-                                    target_path = os.path.join(original_path, file_info.filename)
-                                    file_key = (original_path, file_info.filename)
-                                    
-                                    # Skip if we've already restored this file from a previous backup in the chain
-                                    if file_key in restored_files:
-                                        continue
-                                    
-                                    # For files from differential backup or if file doesn't exist
-                                    if chain_backup_name != backup_chain[0][0] or not os.path.exists(target_path):
-                                        folder_zip.extract(file_info, original_path)
-                                        log(f"Restored: {target_path}")
-                                        restored_files.add(file_key)
-                                    else:
-                                        # For full backup files that exist, ask before overwriting
-                                        if input(f"File {file_info.filename} already exists. Overwrite? (y/n): ").lower() == 'y':
-                                            folder_zip.extract(file_info, original_path)
-                                            log(f"Restored: {target_path}")
-                                            restored_files.add(file_key)
-                                        else:
-                                            log(f"Skipped existing file: {target_path}")
-                                
-                                log(f"Completed restore of {folder_zip_name} to {original_path}")
+                                restore_folder(folder_zip, '', folder_zip_name, is_base_backup, restored_files,
+                                               duplicates.get(folder_zip_name))
                         except Exception as e:
                             log(f"Error processing folder zip {folder_zip_name}: {str(e)}")
                             print(f"Failed to restore {folder_zip_name}: {str(e)}")
@@ -394,77 +1118,206 @@ def restore_backup(backup_name, selected_folders=None):
         log(error_msg)
         raise
 
-def execute_backup():
+def has_embedded_manifest(backup_path):
+    """Tell whether a backup archive carries its manifest as its MANIFEST_NAME entry."""
+    try:
+        with zipfile.ZipFile(backup_path) as backup_zip:
+            return MANIFEST_NAME in backup_zip.NameToInfo
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+def is_current_manifest(manifest):
+    """Tell a {'hash_algo', 'files', ...} manifest from an older one keyed by arcname, whose values are all dicts."""
+    return isinstance(manifest.get('hash_algo'), str) and isinstance(manifest.get('files'), dict)
+
+def load_manifest(backup_path):
+    """Read a backup's manifest as {arcname: [hash, time, size]}, with orjson when it is installed."""
+    # Older backups keep it next to the archive, as one dict per file
+    legacy_path = backup_path.replace('.zip', '_manifest.json')
+    if os.path.exists(legacy_path):
+        with open(legacy_path, 'rb') as f:
+            data = f.read()
+    else:
+        with zipfile.ZipFile(backup_path) as backup_zip:
+            data = backup_zip.read(MANIFEST_NAME)
+    manifest = orjson.loads(data) if orjson is not None else json.loads(data)
+    
+    if is_current_manifest(manifest):
+        files = manifest['files']
+        # Hashes from another algorithm can't be compared; size is None in entries that predate it
+        if manifest.get('hash_algo') != HASH_ALGO:
+            for info in files.values():
+                info[0] = None
+        return files
+    
+    # Older manifests key files by os.sep paths
+    normalise = (lambda name: name.replace(os.sep, '/')) if os.sep != '/' else (lambda name: name)
+    return {normalise(name): [info.get('hash') if info.get('hash_algo', 'sha256') == HASH_ALGO else None,
+                              info.get('time'), info.get('size')]
+            for name, info in manifest.items()}
+
+def load_duplicates(backup_zip):
+    """Read the duplicate maps of an open backup archive as {folder label: {name: stored name}}."""
+    try:
+        data = backup_zip.read(MANIFEST_NAME)
+    except KeyError:
+        return {}
+    manifest = orjson.loads(data) if orjson is not None else json.loads(data)
+    duplicates = manifest.get('duplicates') if is_current_manifest(manifest) else None
+    return duplicates if isinstance(duplicates, dict) else {}
+
+def save_manifest(backup_zip, manifest, duplicates):
+    """Write a manifest and the duplicate map of each folder into the backup archive."""
+    manifest = {'hash_algo': HASH_ALGO, 'files': manifest, 'duplicates': duplicates}
+    if orjson is not None:
+        data = orjson.dumps(manifest)
+    else:
+        # Compact like orjson's output; the separator spaces only add bytes to encode and deflate
+        data = json.dumps(manifest, separators=(',', ':')).encode('utf-8')
+    # The level is shared with zstd, whose levels go past what the DEFLATE backend accepts
+    backup_zip.writestr(MANIFEST_NAME, data, compress_type=zipfile.ZIP_DEFLATED,
+                        compresslevel=min(compression_level, MAX_COMPRESSION_LEVEL))
+
+def find_bad_entry(backup_zip):
+    """Return the first entry of a backup archive that fails its CRC check, or None."""
+    for zinfo in backup_zip.infolist():
+        try:
+            # Only top-level .zip members are folder zips; others are user files, as in restore_backup
+            if zinfo.filename.endswith('.zip') and '/' not in zinfo.filename:
+                # Streamed, so no folder zip is read into memory whole
+                with backup_zip.open(zinfo) as stream, zipfile.ZipFile(stream) as folder_zip:
+                    bad_entry = folder_zip.testzip()
+                if bad_entry is not None:
+                    return f"{zinfo.filename}/{bad_entry}"
+            else:
+                with backup_zip.open(zinfo) as f:
+                    while f.read(COPY_CHUNK_SIZE):
+                        pass
+        except zipfile.BadZipFile:
+            return zinfo.filename
+    return None
+
+def execute_backup(verify=False):
     """Execute the backup operation with progress bars and differential backup support."""
-    # Determine backup type
-    is_full_backup = backup_type == 'full' or should_create_full_backup()
+    # Determine backup type. The last full backup is looked up once, as checking it
+    # for an embedded manifest opens the archive.
+    last_full_backup = last_full_path = None
+    if backup_type != 'full':
+        last_full_backup, last_full_path = get_last_full_backup()
+    is_full_backup = backup_type == 'full' or should_create_full_backup(last_full_backup)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
     # Set backup name based on type
     backup_prefix = "backup_full_" if is_full_backup else "backup_diff_"
     backup_session_name = f"{backup_prefix}{timestamp}.zip"
     backup_session_path = os.path.join(backup_destination, backup_session_name)
+    # The archive is written under a temporary name and only renamed once complete,
+    # so an interrupted run never leaves a truncated backup that counts towards retention
+    partial_session_path = backup_session_path + '.tmp'
+    # With the lock held, any temporary archive left in the destination belongs to a run that died
+    if not lock_destination():
+        log(f"Another backup is already running in {backup_destination}, skipping this one")
+        print("Another backup is already running")
+        return
+    remove_partial_backups()
     
     # Load base manifest for differential backup
     base_manifest = None
     if not is_full_backup:
-        last_full_backup, manifest_path = get_last_full_backup()
-        if manifest_path and os.path.exists(manifest_path):
+        # get_last_full_backup only reports a full backup that has a manifest
+        if last_full_path:
             try:
-                with open(manifest_path, 'r') as f:
-                    base_manifest = json.load(f)
+                base_manifest = load_manifest(last_full_path)
             except Exception as e:
                 log(f"Error loading base manifest, falling back to full backup: {str(e)}")
                 is_full_backup = True
     
-    folders_to_backup = read_folders()
     backup_type_str = "FULL" if is_full_backup else "DIFFERENTIAL"
     print(f"\nStarting {backup_type_str} backup operation...")
+    if compression_method == 'zstd' and zip_compression == zipfile.ZIP_DEFLATED:
+        log("Zstandard compression needs Python 3.14 or newer, using DEFLATE instead")
+    elif compression_method not in ('deflate', 'zstd', 'stored') and zip_compression == zipfile.ZIP_DEFLATED:
+        log(f"Unknown compression '{compression_method}', using DEFLATE instead")
+    if compression_level != requested_compression_level:
+        # isal, for one, only has DEFLATE levels up to 3
+        backend = zlib.__name__.split('.')[0] if zip_compression == zipfile.ZIP_DEFLATED else 'Zstandard'
+        log(f"compression_level {requested_compression_level} is not supported by {backend}, using {compression_level}")
     
     try:
         complete_manifest = {}
+        complete_duplicates = {}
         total_files_processed = 0
         
-        with zipfile.ZipFile(backup_session_path, 'w', zipfile.ZIP_DEFLATED) as main_zip:
-            for folder_path, is_recursive in folders_to_backup:
-                folder_manifest, files_processed = backup_folder(
-                    main_zip, 
-                    folder_path, 
-                    is_recursive,
-                    complete_manifest,
-                    base_manifest
-                )
+        # Each folder is zipped in its own process; the parent stitches the
+        # finished folder zips into the session archive and zips the folders
+        # too large to pass back in memory straight into it.
+        # The pool starts all its workers at once, so a short folder list gets fewer of them
+        configured_folders = list(read_folders())
+        max_workers = max(1, min(len(configured_folders), os.cpu_count() or 1))
+        # Every folder process runs its own file thread pool
+        file_workers = max(2, FILE_WORKERS // max_workers)
+        # Folder zips are already deflated, so the session archive only stores them
+        with open(partial_session_path, 'w+b', buffering=SESSION_BUFFER_SIZE) as session_file, \
+                zipfile.ZipFile(session_file, 'w', zipfile.ZIP_STORED, allowZip64=True) as main_zip, \
+                ProcessPoolExecutor(max_workers=max_workers, initializer=init_folder_worker,
+                                    initargs=(base_manifest,)) as executor:
+            # Finished folder zips wait in memory until the parent writes them, so
+            # only a couple of folders per worker are queued at a time
+            folders = ((folder_path, is_recursive, position)
+                       for position, (folder_path, is_recursive) in enumerate(configured_folders))
+            zip_folder = functools.partial(backup_folder_in_worker, file_workers=file_workers)
+            for (folder_path, is_recursive, position), future in completed_bounded(
+                    executor, zip_folder, folders, max_workers * 2):
+                (folder_zip_filename, zip_data, deferred_files, entries,
+                 folder_manifest, folder_duplicates, files_processed, messages) = future.result()
+                for message in messages:
+                    log(message)
+                
+                if entries is not None:
+                    for zinfo, payload in entries:
+                        write_compressed(main_zip, zinfo, payload)
+                elif zip_data is not None:
+                    main_zip.writestr(folder_zip_filename, zip_data, compress_type=zipfile.ZIP_STORED)
+                elif deferred_files is not None:
+                    (_, _, _, _, folder_manifest, folder_duplicates, files_processed, messages) = backup_folder(
+                        folder_path, is_recursive, base_manifest, position,
+                        session_zip=main_zip, files=deferred_files, file_workers=file_workers)
+                    for message in messages:
+                        log(message)
+                
                 complete_manifest.update(folder_manifest)
+                if folder_duplicates:
+                    # Keyed the way restore_backup labels folders: "<folder>/" or "<folder>.zip"
+                    folder_label = folder_zip_filename[:-len('.zip')] + '/' if entries is not None else folder_zip_filename
+                    complete_duplicates[folder_label] = folder_duplicates
                 total_files_processed += files_processed
+            
+            # The manifest goes last, so it is only there once every folder made it in
+            save_manifest(main_zip, complete_manifest, complete_duplicates)
         
-        # Save manifest for this backup
-        manifest_path = backup_session_path.replace('.zip', '_manifest.json')
-        with open(manifest_path, 'w') as f:
-            json.dump(complete_manifest, f)
-        
-        # If no files were processed in differential backup, clean up
-        if not is_full_backup and total_files_processed == 0:
-            os.remove(backup_session_path)
-            os.remove(manifest_path)
+        # A differential's manifest only lists the files it added, so an empty one
+        # means nothing changed since the full backup; unchanged files still count
+        # as processed, so files_processed can't tell
+        if not is_full_backup and not complete_manifest:
+            os.remove(partial_session_path)
             log("No changes detected, differential backup not needed")
             print("No changes detected since last backup")
             return
         
-        # Verify the final backup
-        log("Verifying final backup...")
-        try:
-            with zipfile.ZipFile(backup_session_path, 'r') as verify_zip:
-                for name in verify_zip.namelist():
-                    if name.endswith('.zip'):
-                        zip_data = verify_zip.read(name)
-                        if not verify_zip_content(zip_data):
-                            raise Exception(f"Verification failed for {name}")
-                        log(f"Verified {name} in backup")
-            log("Backup verification completed successfully")
-        except Exception as e:
-            log(f"Backup verification failed: {str(e)}")
-            raise
+        # Verify the final backup; zipfile checks every entry's CRC as it reads
+        if verify:
+            log("Verifying final backup...")
+            try:
+                with zipfile.ZipFile(partial_session_path, 'r') as verify_zip:
+                    bad_entry = find_bad_entry(verify_zip)
+                if bad_entry is not None:
+                    raise Exception(f"Verification failed for {bad_entry}")
+                log("Backup verification completed successfully")
+            except Exception as e:
+                log(f"Backup verification failed: {str(e)}")
+                raise
         
+        os.replace(partial_session_path, backup_session_path)
         enforce_backup_limit()
         log(f"{backup_type_str} backup operation completed successfully")
         print(f"{backup_type_str} backup completed. {total_files_processed} files processed.")
@@ -473,10 +1326,10 @@ def execute_backup():
         error_msg = f"Critical error during backup operation: {str(e)}"
         print(error_msg)
         log(error_msg)
-        if os.path.exists(backup_session_path):
+        if os.path.exists(partial_session_path):
             try:
-                os.remove(backup_session_path)
-                log(f"Removed failed backup: {backup_session_path}")
+                os.remove(partial_session_path)
+                log(f"Removed failed backup: {partial_session_path}")
             except Exception as cleanup_error:
                 log(f"Could not remove failed backup: {str(cleanup_error)}")
         raise
@@ -486,11 +1339,12 @@ def main():
     parser.add_argument('action', choices=['backup', 'restore', 'list'], help='Action to perform: backup, restore, or list backups')
     parser.add_argument('--backup-name', help='Name of the backup to restore')
     parser.add_argument('--folders', nargs='+', help='Specific folders to restore')
+    parser.add_argument('--verify', action='store_true', help='Verify the backup archive after it is written')
     
     args = parser.parse_args()
     
     if args.action == 'backup':
-        execute_backup()
+        execute_backup(args.verify)
     elif args.action == 'list':
         list_backups()
     elif args.action == 'restore':
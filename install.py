@@ -98,14 +98,16 @@ def check_environment():
 def download_file(url, dest_path):
     """Download a file with proper error handling"""
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-        
-        with open(dest_path, 'wb') as f:
-            f.write(response.content)
+        # Stream the body to disk instead of holding the whole download in memory
+        with requests.get(url, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            
+            # Ensure directory exists
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            
+            with open(dest_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
         print(f"Downloaded {url} to {dest_path}")
     except requests.exceptions.RequestException as e:
         raise RuntimeError(f"Failed to download {url}: {str(e)}")